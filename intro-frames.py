@@ -5,6 +5,8 @@ Anthony Brown May 2022 - May 2022
 """
 import argparse
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
 from matplotlib.patches import FancyArrowPatch, ArrowStyle
@@ -33,19 +35,24 @@ def make_frames():
     gs = GridSpec(1, 1, figure=fig)
     ax = fig.add_subplot(gs[0, 0], projection=sky_proj)
     ax.imshow(gaiasky, transform=default_proj, origin='upper')
-    plt.savefig("frames/intro-frame-A.png")
+    # Render the sky image only once. The following frames add elements on top of the previous frame, so only the new
+    # artists are drawn onto the canvas before the canvas buffer is saved.
+    fig.canvas.draw()
+    plt.imsave("frames/intro-frame-A.png", np.asarray(fig.canvas.buffer_rgba()))
     
-    ax.plot([-180,180], [0,0], c='w', lw=6, alpha=0.5, transform=default_proj)
-    plt.savefig("frames/intro-frame-B.png")
+    ax.draw_artist(ax.plot([-180,180], [0,0], c='w', lw=6, alpha=0.5, transform=default_proj, animated=True)[0])
+    plt.imsave("frames/intro-frame-B.png", np.asarray(fig.canvas.buffer_rgba()))
 
     for galon, label in zip([-120,-60, 0, 60, 120], [120, 60, 0, 300, 240]):
-        ax.plot([galon, galon], [-5,5], c='w', lw=3, transform=default_proj)
-        ax.text(galon, -20, fr"$l={label}^\circ$", color='w', ha='center', fontsize=28, transform=default_proj)
-    plt.savefig("frames/intro-frame-C.png")
+        ax.draw_artist(ax.plot([galon, galon], [-5,5], c='w', lw=3, transform=default_proj, animated=True)[0])
+        ax.draw_artist(ax.text(galon, -20, fr"$l={label}^\circ$", color='w', ha='center', fontsize=28,
+            transform=default_proj, animated=True))
+    plt.imsave("frames/intro-frame-C.png", np.asarray(fig.canvas.buffer_rgba()))
 
     for galon in np.arange(-150,180,30):
-        ax.arrow(galon, 15, -10, 0, color='w', linewidth=3, head_width=2, transform=default_proj)
-    plt.savefig("frames/intro-frame-D.png")
+        ax.draw_artist(ax.arrow(galon, 15, -10, 0, color='w', linewidth=3, head_width=2, transform=default_proj,
+            animated=True))
+    plt.imsave("frames/intro-frame-D.png", np.asarray(fig.canvas.buffer_rgba()))
 
     plt.close(fig)
 
@@ -11,15 +11,102 @@ import numpy as np
 
 import astropy.units as u
 import astropy.constants as c
-from astropy.coordinates import cartesian_to_spherical
 
 from gala.potential.potential.builtin.special import BovyMWPotential2014
 
 from pygaia.astrometry.vectorastrometry import normal_triad
 
+try:
+    from numba import njit, prange
+    _have_numba = True
+except ImportError:
+    _have_numba = False
+
 _au_km_year_per_sec = (c.au / (1*u.yr).to(u.s)).to(u.km/u.s).value
 
 
+def _observables_kernel_numpy(dist_kpc, p, q, r, starpos_kpc, vphistar_kms, vsun_kms):
+    """
+    Calculate the proper motions and radial and tangential velocities of stars on circular orbits. All inputs and
+    outputs are plain float arrays in fixed units, the public methods of DiskKinematicModel take care of the astropy
+    units.
+
+    Parameters
+    ----------
+
+    dist_kpc: float array, shape (...)
+        Distances to the stars in kpc.
+    p, q, r: float arrays, shape (3,...)
+        Normal triads for the directions to the stars.
+    starpos_kpc: float array, shape (3,...)
+        Galactocentric Cartesian positions of the stars in kpc.
+    vphistar_kms: float array, shape (...)
+        Azimuthal velocities of the stars in km/s.
+    vsun_kms: float 3-array
+        Galactocentric Cartesian velocity of the sun in km/s.
+
+    Returns
+    -------
+
+    Proper motions in l and b, radial velocities, and tangential velocities. Units are mas/yr and km/s.
+    pml, pmb, vrad, vtan = _observables_kernel_numpy(dist_kpc, p, q, r, starpos_kpc, vphistar_kms, vsun_kms)
+    """
+    r_xy = np.hypot(starpos_kpc[0], starpos_kpc[1])
+    sinphi = starpos_kpc[1]/r_xy
+    cosphi = starpos_kpc[0]/r_xy
+    vdiff_x = -vphistar_kms*sinphi - vsun_kms[0]
+    vdiff_y = vphistar_kms*cosphi - vsun_kms[1]
+    vdiff_z = -vsun_kms[2]
+
+    vrad = r[0]*vdiff_x + r[1]*vdiff_y + r[2]*vdiff_z
+    vl = p[0]*vdiff_x + p[1]*vdiff_y + p[2]*vdiff_z
+    vb = q[0]*vdiff_x + q[1]*vdiff_y + q[2]*vdiff_z
+    pml = vl / (dist_kpc * _au_km_year_per_sec)
+    pmb = vb / (dist_kpc * _au_km_year_per_sec)
+    vtan = np.hypot(vl, vb)
+
+    return pml, pmb, vrad, vtan
+
+
+if _have_numba:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _observables_loop(dist_kpc, p, q, r, starpos_kpc, vphistar_kms, vsun_kms):
+        """
+        Numba compiled version of _observables_kernel_numpy for 1D arrays of stars, parallelized over the stars.
+        """
+        n = dist_kpc.size
+        pml = np.empty(n)
+        pmb = np.empty(n)
+        vrad = np.empty(n)
+        vtan = np.empty(n)
+        for i in prange(n):
+            r_xy = np.sqrt(starpos_kpc[0,i]**2 + starpos_kpc[1,i]**2)
+            vdiff_x = -vphistar_kms[i]*starpos_kpc[1,i]/r_xy - vsun_kms[0]
+            vdiff_y = vphistar_kms[i]*starpos_kpc[0,i]/r_xy - vsun_kms[1]
+            vdiff_z = -vsun_kms[2]
+            vrad[i] = r[0,i]*vdiff_x + r[1,i]*vdiff_y + r[2,i]*vdiff_z
+            vl = p[0,i]*vdiff_x + p[1,i]*vdiff_y + p[2,i]*vdiff_z
+            vb = q[0,i]*vdiff_x + q[1,i]*vdiff_y + q[2,i]*vdiff_z
+            pml[i] = vl / (dist_kpc[i] * _au_km_year_per_sec)
+            pmb[i] = vb / (dist_kpc[i] * _au_km_year_per_sec)
+            vtan[i] = np.hypot(vl, vb)
+        return pml, pmb, vrad, vtan
+
+    def _observables_kernel(dist_kpc, p, q, r, starpos_kpc, vphistar_kms, vsun_kms):
+        """
+        Calculate the proper motions and radial and tangential velocities of stars on circular orbits with the Numba
+        compiled loop. Inputs and outputs as for _observables_kernel_numpy.
+        """
+        shape = np.shape(dist_kpc)
+        as1d = lambda x : np.ascontiguousarray(x, dtype=np.float64).reshape(-1)
+        as3n = lambda x : np.ascontiguousarray(x, dtype=np.float64).reshape(3, -1)
+        pml, pmb, vrad, vtan = _observables_loop(as1d(dist_kpc), as3n(p), as3n(q), as3n(r), as3n(starpos_kpc),
+                as1d(vphistar_kms), as1d(vsun_kms))
+        return pml.reshape(shape), pmb.reshape(shape), vrad.reshape(shape), vtan.reshape(shape)
+else:
+    _observables_kernel = _observables_kernel_numpy
+
+
 class SlopedRotationCurve(BovyMWPotential2014):
     """
     Implements a very simple kinematic model of the disk in which the circular velocity is given by a linear
@@ -51,8 +138,8 @@ class SlopedRotationCurve(BovyMWPotential2014):
         self.slope = slope*u.km/u.s/u.kpc
 
     def circular_velocity(self, q):
-        rq = np.sqrt(q[0]**2 + q[1]**2).to(u.kpc)
-        return self.the_pot.circular_velocity(q)*0.0 + self.vcircsun + ((rq-self.rsun)*self.slope).to(u.km/u.s)
+        rq = np.atleast_1d(np.sqrt(q[0]**2 + q[1]**2).to(u.kpc))
+        return self.vcircsun + ((rq-self.rsun)*self.slope).to(u.km/u.s)
 
     def oort_ab(self, q):
         rq = np.sqrt(q[0]**2 + q[1]**2).to(u.kpc)
@@ -86,7 +173,7 @@ class FlatRotationCurve(BovyMWPotential2014):
         self.vcirc = vcirc*u.km/u.s
     
     def circular_velocity(self, q):
-        return self.the_pot.circular_velocity(q)*0.0 + self.vcirc
+        return np.full(np.atleast_1d(q[0]).shape, self.vcirc.to(u.km/u.s).value)*u.km/u.s
 
     def oort_ab(self, q):
         rq = np.sqrt(q[0]**2 + q[1]**2).to(u.kpc)
@@ -123,8 +210,8 @@ class SolidBodyRotationCurve(BovyMWPotential2014):
         self.rsun = rsun*u.pc
     
     def circular_velocity(self, q):
-        rq = np.sqrt(q[0]**2 + q[1]**2).to(u.pc)
-        return self.the_pot.circular_velocity(q)*0.0 + self.vcircsun*(rq/self.rsun).value
+        rq = np.atleast_1d(np.sqrt(q[0]**2 + q[1]**2).to(u.pc))
+        return self.vcircsun*(rq/self.rsun).value
 
     def oort_ab(self, q):
         return 0.0*u.km/u.s/u.kpc, 0.0*u.km/u.s/u.kpc
@@ -162,11 +249,13 @@ class BrunettiPfennigerRotationCurve(BovyMWPotential2014):
         self.rsun = rsun*u.pc
         self.h = h*u.kpc
         self.p = p
-        self.v0 = (self.vcircsun/(self.rsun.to(u.kpc)/self.h * np.power(1 + (self.rsun.to(u.kpc)/self.h)**2, (self.p-2)/4))).to(u.km/u.s)
+        self._pexp = (self.p-2)/4
+        self._hkpc = self.h.to(u.kpc).value
+        self.v0 = (self.vcircsun/(self.rsun.to(u.kpc)/self.h * np.power(1 + (self.rsun.to(u.kpc)/self.h)**2, self._pexp))).to(u.km/u.s)
     
     def circular_velocity(self, q):
-        rq = np.sqrt(q[0]**2 + q[1]**2).to(u.kpc)
-        return self.the_pot.circular_velocity(q)*0.0 + self.v0*(rq/self.h * np.power(1 + (rq/self.h).value**2, (self.p-2)/4))
+        rh = np.atleast_1d(np.sqrt(q[0].to(u.kpc).value**2 + q[1].to(u.kpc).value**2)) / self._hkpc
+        return (self.v0.value * rh * (1.0 + rh*rh)**self._pexp)*u.km/u.s
 
     def oort_ab(self, q):
         rq = np.sqrt(q[0]**2 + q[1]**2).to(u.kpc)
@@ -205,7 +294,8 @@ class DiskKinematicModel:
         self.sunpos = sunpos
         self.vsunpec = vsunpeculiar
         self.vphisun = -self.pot.circular_velocity(self.sunpos)[0]
-        self.vsun = np.array([0, -self.vphisun.value, 0])*u.km/u.s + self.vsunpec
+        self._vsun_rot = np.array([0, -self.vphisun.to(u.km/u.s).value, 0])*u.km/u.s
+        self.vsun = self._vsun_rot + self.vsunpec
 
     def get_circular_velocity(self, pos):
         """
@@ -241,7 +331,28 @@ class DiskKinematicModel:
         """
         return self.pot.oort_ab(q)
 
-    def observables(self, distance, l, b, vsunpec=np.nan, sunpos=np.nan):
+    @staticmethod
+    def precompute_triad(l, b):
+        """
+        Calculate the normal triads for the input sightlines, for re-use in repeated calls to observables().
+
+        Parameters
+        ----------
+
+        l: astropy angle-like Quantity, float array
+            The Galactic longitude of the stars. Default unit is radians (used for plain float arrays).
+        b: astropy angle-like Quantity, float array
+            The Galactic latitude of the stars. Default unit is radians (used for plain float arrays).
+
+        Returns
+        -------
+
+        The normal triad vectors as plain float arrays of shape (3,N).
+        p, q, r = precompute_triad(l, b)
+        """
+        return normal_triad(u.Quantity(l, u.rad).value, u.Quantity(b, u.rad).value)
+
+    def observables(self, distance, l, b, vsunpec=None, sunpos=None, triad=None):
         """
         Calculate the proper motions and radial velocities for stars at a given distance and galactic coordinate (l,b).
 
@@ -262,6 +373,10 @@ class DiskKinematicModel:
             Custom value for the sun's peculiar velocity, by default same as value used for model initialization
         sunpos: astropy quantity, float 3-array
             Custom value for the sun's position, by default same as value used for model initialization
+        triad: tuple of three float arrays of shape (3,N)
+            The normal triads (p, q, r) for the sightlines (l, b), as calculated with precompute_triad(l, b). When
+            observables are calculated repeatedly for the same sightlines (for example for many different potentials)
+            precompute the triads once and pass them in here to avoid recalculating them on each call.
 
         Returns
         -------
@@ -269,31 +384,25 @@ class DiskKinematicModel:
         Proper motions in l and b, and the radial velocities. Units are mas/yr and km/s.
         pml, pmb, vrad = observables(distance, l, b).
         """
-        p, q, r = normal_triad(l,b)
-        if np.any(np.isnan(vsunpec)):
+        if vsunpec is None:
             vsunpec = self.vsunpec
-        if np.any(np.isnan(sunpos)):
+        if sunpos is None:
             sunpos = self.sunpos
-        vsun = np.array([0, -self.vphisun.value, 0])*u.km/u.s + vsunpec
+        vsun = self._vsun_rot + vsunpec
 
-        starpos = ((distance*r).T+sunpos).T
-        vphistar = -self.pot.circular_velocity(starpos)
-        phi = np.arctan2(starpos[1,:], starpos[0,:])
+        dist_kpc = distance.to(u.kpc).value
+        if triad is None:
+            p, q, r = self.precompute_triad(l, b)
+        else:
+            p, q, r = triad
+        starpos_kpc = dist_kpc*r + sunpos.to(u.kpc).value.reshape((3,) + (1,)*dist_kpc.ndim)
+        vphistar_kms = -self.pot.circular_velocity(starpos_kpc.reshape(3, -1)*u.kpc).to(u.km/u.s).value.reshape(
+                dist_kpc.shape)
 
-        vstar = np.vstack((-vphistar*np.sin(phi), vphistar*np.cos(phi), np.zeros_like(vphistar)))
-        vdiff = (vstar.T-vsun).T
+        pml, pmb, vrad, vtan = _observables_kernel(dist_kpc, p, q, r, starpos_kpc, vphistar_kms,
+                vsun.to(u.km/u.s).value)
 
-        vrad = np.zeros(distance.size)*u.km/u.s
-        pml = np.zeros(distance.shape)*u.mas/u.yr
-        pmb = np.zeros(distance.shape)*u.mas/u.yr
-        for i in range(distance.size):
-            vrad[i] = np.dot(r[:,i], vdiff[:,i])
-            pml[i] = (np.dot(p[:,i], vdiff[:,i]).to(u.km/u.s)/(distance[i].to(u.kpc) *
-                _au_km_year_per_sec)).value*u.mas/u.yr
-            pmb[i] = (np.dot(q[:,i], vdiff[:,i]).to(u.km/u.s)/(distance[i].to(u.kpc) *
-                _au_km_year_per_sec)).value*u.mas/u.yr
-
-        return pml, pmb, vrad
+        return pml*u.mas/u.yr, pmb*u.mas/u.yr, vrad*u.km/u.s
 
     def differential_velocity_field(self, xgrid, ygrid, z):
         """
@@ -317,28 +426,22 @@ class DiskKinematicModel:
         pml, pmb, vrad, vtan, p, q, r = differential_velocity_field(xgrid, ygrid, z). Units mas/yr, mas/yr, km/s, km/s
         """
 
-        zgrid = np.zeros_like(xgrid) + z
-        phi=np.arctan2(ygrid, xgrid)
-
-        vphistar = -self.pot.circular_velocity([xgrid, ygrid, zgrid])
-        vstar = np.stack((-vphistar*np.sin(phi), vphistar*np.cos(phi), np.zeros_like(vphistar)))
-        vdiff = (vstar.T-self.vsun).T
-
-        dist, b, l = cartesian_to_spherical(xgrid-self.sunpos[0], ygrid-self.sunpos[1], zgrid-self.sunpos[2])
-        p, q, r = normal_triad(l, b)
-
-        vrad = np.zeros(xgrid.shape) * u.km/u.s
-        pml = np.zeros(xgrid.shape) * u.mas/u.yr
-        pmb = np.zeros(xgrid.shape) * u.mas/u.yr
-        vtan = np.zeros(xgrid.shape) * u.km/u.s
-        for i in range(xgrid.shape[0]):
-            for j in range(xgrid.shape[1]):
-                vrad[i,j] = np.dot(r[:,i,j], vdiff[:,i,j])
-                pml[i,j] = (np.dot(p[:,i,j], vdiff[:,i,j]).to(u.km/u.s)/(dist[i,j].to(u.kpc) *
-                    _au_km_year_per_sec)).value*u.mas/u.yr
-                pmb[i,j] = (np.dot(q[:,i,j], vdiff[:,i,j]).to(u.km/u.s)/(dist[i,j].to(u.kpc) *
-                    _au_km_year_per_sec)).value*u.mas/u.yr
-        vtan = np.sqrt(vdiff[0,:,:]**2+vdiff[1,:,:]**2+vdiff[2,:,:]**2-vrad**2)
-
-        return pml, pmb, vrad, vtan, p, q, r
+        z_kpc = z.to(u.kpc).value
+
+        # Evaluate the rotation curve for all grid points in one call on a flat (3,N*N) array of positions.
+        starpos_kpc = np.stack((xgrid.to(u.kpc).value, ygrid.to(u.kpc).value, np.broadcast_to(z_kpc, xgrid.shape)))
+        vphistar_kms = -self.pot.circular_velocity(starpos_kpc.reshape(3, -1)*u.kpc).to(u.km/u.s).value.reshape(
+                xgrid.shape)
+
+        dx = (xgrid-self.sunpos[0]).to(u.kpc).value
+        dy = (ygrid-self.sunpos[1]).to(u.kpc).value
+        dz = z_kpc - self.sunpos[2].to(u.kpc).value
+        dxy = np.hypot(dx, dy)
+        dist_kpc = np.sqrt(dxy**2 + dz**2)
+        p, q, r = normal_triad(np.arctan2(dy, dx), np.arctan2(dz, dxy))
+
+        pml, pmb, vrad, vtan = _observables_kernel(dist_kpc, p, q, r, starpos_kpc, vphistar_kms,
+                self.vsun.to(u.km/u.s).value)
+
+        return pml*u.mas/u.yr, pmb*u.mas/u.yr, vrad*u.km/u.s, vtan*u.km/u.s, p, q, r
 
@@ -58,7 +58,8 @@ def transform_to_galactic(icrs_coords, galcendist=_Rsun, sunheight=_zsun, vcircs
     sun_motion = CartesianDifferential(vsunpec[0], vcircsun+vsunpec[1], vsunpec[2])
     galactocentric_cartesian = icrs_coords.transform_to(Galactocentric(galcen_distance=galcendist, z_sun=sunheight, galcen_v_sun=sun_motion))
     galactocentric_cartesian.set_representation_cls(base='cartesian')
-    galactocentric_cylindrical = icrs_coords.transform_to(Galactocentric(galcen_distance=galcendist, z_sun=sunheight, galcen_v_sun=sun_motion))
+    # Re-use the transformed data for the cylindrical representation instead of transforming a second time.
+    galactocentric_cylindrical = galactocentric_cartesian.realize_frame(galactocentric_cartesian.data)
     galactocentric_cylindrical.set_representation_cls(base='cylindrical')
 
     return galactic_coords, galactocentric_cartesian, galactocentric_cylindrical
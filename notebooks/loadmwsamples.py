@@ -49,11 +49,10 @@ def correct_radvel_uncertainty(dr3_radvel_unc, dr3_grvs):
 
     Inflated radial velocity uncertainties as float array.
     """
-    infl_factor = np.ones_like(dr3_radvel_unc)
     bright = (dr3_grvs>8) & (dr3_grvs<=12.0)
     faint = dr3_grvs>12.0
-    infl_factor[bright] = 0.318 + 0.3884*dr3_grvs[bright] - 0.02778*dr3_grvs[bright]**2
-    infl_factor[faint] = 16.554 - 2.4899*dr3_grvs[faint] + 0.09933*dr3_grvs[faint]**2
+    infl_factor = np.where(bright, np.polyval([-0.02778, 0.3884, 0.318], dr3_grvs),
+            np.where(faint, np.polyval([0.09933, -2.4899, 16.554], dr3_grvs), 1.0))
     return infl_factor * dr3_radvel_unc
 
 
@@ -76,12 +75,11 @@ def correct_radvel(dr3_radvel, dr3_template_teff, dr3_grvs):
 
     Corrected radial velocities as float array.
     """
-    radvel_correct = dr3_radvel
     hot = (dr3_template_teff>=8500.0) & (dr3_template_teff<=14500.0) & (dr3_grvs>=6.0) & (dr3_grvs<=12.0)
     cool = (dr3_grvs>=11.0) & (dr3_template_teff<8500.0)
-    radvel_correct[hot] = radvel_correct[hot] - 7.98 + 1.135*dr3_grvs[hot]
-    radvel_correct[cool] = radvel_correct[cool] + 0.02755*dr3_grvs[cool]**2 - 0.55863*dr3_grvs[cool] + 2.81129
-    return radvel_correct
+    corr_hot = np.polyval([1.135, -7.98], dr3_grvs)
+    corr_cool = np.polyval([0.02755, -0.55863, 2.81129], dr3_grvs)
+    return np.where(hot, dr3_radvel + corr_hot, np.where(cool, dr3_radvel + corr_cool, dr3_radvel))
 
 
 def load_mwtable(file, esphs=True, Rsun=_Rsun, zsun=_zsun, sunpos=_sunpos, vsunpeculiar=_vsunpeculiar, vcircsun=_vcircsun):
@@ -134,11 +132,7 @@ def load_mwtable(file, esphs=True, Rsun=_Rsun, zsun=_zsun, sunpos=_sunpos, vsunp
     galactic_coords, galactocentric_cartesian, galactocentric_cylindrical = transform_to_galactic(icrs_coords,
             galcendist=Rsun, sunheight=zsun, vcircsun=vcircsun, vsunpec=vsunpeculiar)
 
-    l, b = ct.transform_sky_coordinates(np.deg2rad(gaiatable['ra']), np.deg2rad(gaiatable['dec']))
-    gaiatable['l'] = np.rad2deg(l)
-    gaiatable['b'] = np.rad2deg(b)
-    gaiatable['pml'], gaiatable['pmb'] = ct.transform_proper_motions(np.deg2rad(gaiatable['ra']), 
-        np.deg2rad(gaiatable['dec']), gaiatable['pmra'], gaiatable['pmdec'])
+    # The astropy transformation does not propagate the proper motion uncertainties, use PyGaia for those.
     gaiatable['pml_error'], gaiatable['pmb_error'], gaiatable['pml_pmb_corr'] = \
         ct.transform_proper_motion_errors(np.deg2rad(gaiatable['ra']), np.deg2rad(gaiatable['dec']), \
         gaiatable['pmra_error'], gaiatable['pmdec_error'], rho_muphi_mutheta=gaiatable['pmra_pmdec_corr'])
@@ -169,12 +163,14 @@ def load_mwtable(file, esphs=True, Rsun=_Rsun, zsun=_zsun, sunpos=_sunpos, vsunp
     gaiatable['v_phi_gc'] = -(galactocentric_cylindrical.d_phi.to(u.rad/u.yr)/u.rad * galactocentric_cylindrical.rho).to(u.km/u.s)
     gaiatable['vtot_lsr'] = np.sqrt(gaiatable['v_R_gc']**2 + (gaiatable['v_phi_gc']-vcircsun.value)**2 + gaiatable['v_z_gc']**2)
 
+    # Parallax term of the absolute magnitude, shared by the gspphot and esphs values.
+    plxterm = 5*np.log10(gaiatable['parallax'].data)-10
     gaiatable['gmag0_gspphot'] = gaiatable['phot_g_mean_mag'] - gaiatable['ag_gspphot']
     gaiatable['bp_rp0_gspphot'] = gaiatable['bp_rp'] - gaiatable['ebpminrp_gspphot']
-    gaiatable['mg_abs0_gspphot'] = gaiatable['gmag0_gspphot'] + 5*np.log10(gaiatable['parallax'])-10
+    gaiatable['mg_abs0_gspphot'] = gaiatable['gmag0_gspphot'] + plxterm
     if (esphs):
         gaiatable['gmag0_esphs'] = gaiatable['phot_g_mean_mag'] - gaiatable['ag_esphs']
         gaiatable['bp_rp0_esphs'] = gaiatable['bp_rp'] - gaiatable['ebpminrp_esphs']
-        gaiatable['mg_abs0_esphs'] = gaiatable['gmag0_esphs'] + 5*np.log10(gaiatable['parallax'])-10
+        gaiatable['mg_abs0_esphs'] = gaiatable['gmag0_esphs'] + plxterm
         
     return gaiatable
@@ -4,12 +4,45 @@ Provides plotting styles.
 Anthony Brown Aug 2015 - Dec 2021
 """
 
+import functools
 import matplotlib.pyplot as plt
-from matplotlib import rc
+from matplotlib import colormaps
 import cycler
 from distinct_colours import get_distinct
 
 
+@functools.lru_cache(maxsize=8)
+def _compute_rc(usetex, fontfam, fontsize, sroncolours, ncolors, axislinewidths, linewidths, lenticks):
+    """
+    Calculate the rc parameter settings for useagab(). The result is cached so that repeated calls with the same
+    arguments do not rebuild the colour cycle.
+
+    Parameters
+    ----------
+    See useagab().
+
+    Returns
+    -------
+    Dictionary with the rc parameter settings.
+    """
+    rcdict = {'text.usetex': usetex}
+    if usetex:
+        rcdict['text.latex.preamble'] = r'\usepackage{amsmath}'
+    if sroncolours:
+        line_colours = get_distinct(ncolors)
+    else:
+        line_colours = colormaps['tab10'].colors[:ncolors]
+    rcdict.update({'font.family': fontfam, 'font.size': fontsize,
+                   'xtick.major.size': lenticks, 'xtick.minor.size': lenticks * 2 / 3,
+                   'ytick.major.size': lenticks, 'ytick.minor.size': lenticks * 2 / 3,
+                   'lines.linewidth': linewidths, 'axes.linewidth': axislinewidths, 'axes.facecolor': 'white',
+                   'axes.prop_cycle': cycler.cycler('color', line_colours),
+                   'xtick.direction': 'out', 'ytick.direction': 'out',
+                   'grid.color': 'cbcbcb', 'grid.linestyle': '-', 'grid.linewidth': 0.5, 'grid.alpha': 1.0,
+                   'figure.dpi': 80, 'figure.subplot.bottom': 0.125})
+    return rcdict
+
+
 def useagab(usetex=False, fontfam='sans-serif', fontsize=18, sroncolours=False, ncolors=10, axislinewidths=1,
             linewidths=2, lenticks=6, return_colours=False):
     """
@@ -40,35 +73,11 @@ def useagab(usetex=False, fontfam='sans-serif', fontsize=18, sroncolours=False,
     -------
     The list of colours used by the colour cycler.
     """
-    if usetex:
-        rc('text', usetex=True)
-        rc('text.latex', preamble=r'\usepackage{amsmath}')
-    else:
-        rc('text', usetex=False)
-    rc('font', family=fontfam, size=fontsize)
-    rc('xtick.major', size=lenticks)
-    rc('xtick.minor', size=lenticks * 2 / 3)
-    rc('ytick.major', size=lenticks)
-    rc('ytick.minor', size=lenticks * 2 / 3)
-    rc('lines', linewidth=linewidths)
-    rc('axes', linewidth=axislinewidths)
-    rc('axes', facecolor='white')
-    if sroncolours:
-        line_colours = get_distinct(ncolors)
-    else:
-        line_colours = plt.cm.get_cmap('tab10').colors[0:ncolors]
-    rc('axes', prop_cycle=(cycler.cycler('color', line_colours)))
-    rc('xtick', direction='out')
-    rc('ytick', direction='out')
-    rc('grid', color='cbcbcb')
-    rc('grid', linestyle='-')
-    rc('grid', linewidth=0.5)
-    rc('grid', alpha=1.0)
-    rc('figure', dpi=80)
-    rc('figure.subplot', bottom=0.125)
+    rcdict = _compute_rc(usetex, fontfam, fontsize, sroncolours, ncolors, axislinewidths, linewidths, lenticks)
+    plt.rcParams.update(rcdict)
 
     if return_colours:
-        return line_colours
+        return rcdict['axes.prop_cycle'].by_key()['color']
 
 
 def apply_tufte(ax, withgrid=False, minorticks=False, gridboth=False, yspine='left'):
@@ -100,8 +109,7 @@ def apply_tufte(ax, withgrid=False, minorticks=False, gridboth=False, yspine='le
         ax.spines['right'].set_position(('outward', 5))
         ax.spines['bottom'].set_position(('outward', 5))
         # Hide the left and top spines
-        ax.spines['left'].set_visible(False)
-        ax.spines['top'].set_visible(False)
+        ax.spines[['left', 'top']].set_visible(False)
         # Only show ticks on the left and bottom spines
         ax.yaxis.set_ticks_position('right')
         ax.xaxis.set_ticks_position('bottom')
@@ -110,14 +118,11 @@ def apply_tufte(ax, withgrid=False, minorticks=False, gridboth=False, yspine='le
         ax.spines['left'].set_position(('outward', 5))
         ax.spines['bottom'].set_position(('outward', 5))
         # Hide the right and top spines
-        ax.spines['right'].set_visible(False)
-        ax.spines['top'].set_visible(False)
+        ax.spines[['right', 'top']].set_visible(False)
         # Only show ticks on the left and bottom spines
         ax.yaxis.set_ticks_position('left')
         ax.xaxis.set_ticks_position('bottom')
 
-    for axis in ['top', 'bottom', 'left', 'right']:
-        ax.spines[axis].set_linewidth(ax.spines[axis].get_linewidth())
     ax.tick_params('both', width=ax.spines['bottom'].get_linewidth(), which='both')
     if withgrid:
         if gridboth:
@@ -5,11 +5,64 @@ in this case are estimated through the median and RSE.
 Anthony Brown May 2015 - June 2022
 """
 
-from numpy import median, sqrt
-from scipy.stats import scoreatpercentile
+from numpy import quantile, sqrt, array, empty, full, sort, isnan, asarray, ascontiguousarray, float64, nan
 from scipy.special import erfinv
 
+try:
+    from numba import njit
+    _have_numba = True
+except ImportError:
+    _have_numba = False
+
 _rse_constant = 1.0/(sqrt(2)*2*erfinv(0.8))
+_probabilities = array([0.10, 0.25, 0.50, 0.75, 0.90])
+
+
+def _quantiles_numpy(x):
+    """
+    Calculate the 10th, 25th, 50th, 75th, and 90th percentile of the values in x.
+
+    Parameters
+    ----------
+
+    x - Array of input values (can be of any dimension)
+
+    Returns
+    -------
+
+    Array with the five percentiles (NaN for empty input, as scipy.stats.scoreatpercentile returned).
+    """
+    values = asarray(x)
+    if values.size == 0:
+        return full(_probabilities.size, nan)
+    return quantile(values, _probabilities)
+
+
+if _have_numba:
+    @njit(cache=True)
+    def _rse_fast(x):
+        """
+        Compiled version of _quantiles_numpy for a 1D float64 array, using the same linear interpolation between
+        data points as numpy.quantile. NaN is returned for empty input.
+        """
+        result = empty(_probabilities.size)
+        if x.size == 0 or isnan(x).any():
+            result[:] = nan
+            return result
+        xsorted = sort(x)
+        for i in range(_probabilities.size):
+            h = (xsorted.size-1)*_probabilities[i]
+            k = int(h)
+            if k+1 < xsorted.size:
+                result[i] = xsorted[k] + (h-k)*(xsorted[k+1]-xsorted[k])
+            else:
+                result[i] = xsorted[k]
+        return result
+
+    def _quantiles(x):
+        return _rse_fast(ascontiguousarray(x, dtype=float64).ravel())
+else:
+    _quantiles = _quantiles_numpy
 
 
 def rse(x):
@@ -27,7 +80,8 @@ def rse(x):
     The Robust Scatter Estimate (RSE), defined as 0.390152 * (P90-P10), where P10 and P90 are the 10th and
     90th percentile of the distribution of x.
     """
-    return _rse_constant * (scoreatpercentile(x, 90) - scoreatpercentile(x, 10))
+    q = _quantiles(x)
+    return _rse_constant * (q[4] - q[0])
 
 
 def robust_stats(x):
@@ -46,12 +100,8 @@ def robust_stats(x):
     value, 'max':maximum value}
     """
 
-    med = median(x)
-    therse = rse(x)
-    lowerq = scoreatpercentile(x, 25)
-    upperq = scoreatpercentile(x, 75)
-    lowerten = scoreatpercentile(x, 10)
-    upperten = scoreatpercentile(x, 90)
+    lowerten, lowerq, med, upperq, upperten = _quantiles(x)
+    therse = _rse_constant * (upperten - lowerten)
 
     return {'median': med, 'rse': therse, 'lowerq': lowerq, 'upperq': upperq, 'lower10': lowerten, 'upper10': upperten,
             'min': x.min(), 'max': x.max(), 'ndata': x.size}
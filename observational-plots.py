@@ -8,30 +8,114 @@ Anthony Brown May 2022 - June 2022
 import sys
 sys.path.insert(1, './notebooks/')
 
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import argparse
+from scipy.stats import binned_statistic_2d
 from matplotlib.gridspec import GridSpec
+from matplotlib.colors import LogNorm
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 from astropy.table import Table
 import astropy.units as u
 import astropy.constants as c
-from astropy.coordinates import ICRS
+from astropy.coordinates import Galactocentric, SkyCoord, CartesianRepresentation
 from astropy.visualization import HistEqStretch, ImageNormalize
 au_km_year_per_sec = (c.au / (1*u.yr).to(u.s)).to(u.km/u.s).value
 
 from pygaia.astrometry.coordinates import Transformations, CoordinateTransformation
 
-from icrstogal import *
-
 _Rsun = 8277.0*u.pc
 _Zsun = 20.8*u.pc
 
+_icrs_to_gal = CoordinateTransformation(Transformations.ICRS2GAL)
+
+# Rotation matrix and offset (in pc) of the ICRS to Galactocentric Cartesian transformation. Only the positions are
+# needed so the transformation is applied directly instead of through the astropy frame machinery. The offset and
+# matrix follow from transforming the ICRS origin and the three ICRS unit vectors.
+_galcen_basis = SkyCoord(CartesianRepresentation(np.array([[0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]])*u.pc),
+        frame='icrs').transform_to(Galactocentric(galcen_distance=_Rsun, z_sun=_Zsun)).cartesian.xyz.to(u.pc).value
+_galcen_offset = _galcen_basis[:, 0]
+_icrs_to_galcen_matrix = _galcen_basis[:, 1:] - _galcen_offset[:, np.newaxis]
+
+# Input file for each source type.
+_input_files = {'O': 'data/OBAGoldenSample.fits', 'B': 'data/OBAGoldenSample.fits', 'A': 'data/OBAGoldenSample.fits',
+        'F': 'data/FGKMGoldenSample.fits', 'G': 'data/FGKMGoldenSample.fits', 'K': 'data/FGKMGoldenSample.fits',
+        'M': 'data/FGKMGoldenSample.fits', 'giants': 'data/FGKMGoldenSample.fits'}
+
+# Columns from the input FITS files that are needed for the plots (the astrophysical parameters are present only in
+# one of the OBA or FGKM files).
+_input_columns = ['ra', 'dec', 'parallax', 'parallax_error', 'pmra', 'pmdec', 'pmra_error', 'pmdec_error',
+        'pmra_pmdec_corr', 'spectraltype_esphs', 'logg_gspphot', 'teff_gspphot']
+
+# Codes used in the startype column for the FGKM dwarfs and the giants (-1 for stars in neither class).
+_startype_codes = {'M': 0, 'K': 1, 'G': 2, 'F': 3, 'giants': 4}
+
+# Increase this when load_raw() changes so that old cache files are not used.
+_cache_version = 1
 
-def load_data(infile):
+
+def galactic_proper_motions(ct, ra_rad, dec_rad, pmra, pmdec, pmra_error, pmdec_error, pmra_pmdec_corr):
     """
-    Load the data from the input file and calculate quantities in the Galactic (Cartesian) coordinate system.
+    Transform the proper motions and their uncertainties from ICRS to Galactic coordinates. This is equivalent to
+    calling ct.transform_proper_motions() and ct.transform_proper_motion_errors(), but the sines and cosines of the
+    source coordinates and the Jacobian of the transformation are calculated only once.
+
+    Parameters
+    ----------
+
+    ct : pygaia.astrometry.coordinates.CoordinateTransformation
+        The ICRS to Galactic coordinate transformation.
+    ra_rad, dec_rad : float arrays
+        Right ascension and declination in radians.
+    pmra, pmdec : float arrays
+        Proper motions in right ascension (including the cos(dec) factor) and declination.
+    pmra_error, pmdec_error, pmra_pmdec_corr : float arrays
+        Uncertainties in the proper motions and the correlation coefficient between them.
+
+    Returns
+    -------
+
+    pml, pmb, pml_error, pmb_error, pml_pmb_corr
+    """
+    sra, cra = np.sin(ra_rad), np.cos(ra_rad)
+    sdec, cdec = np.sin(dec_rad), np.cos(dec_rad)
+    # Normal triad [p, q, r] at (ra, dec), see pygaia.astrometry.vectorastrometry.normal_triad
+    p = np.array([-sra, cra, np.zeros_like(ra_rad)])
+    q = np.array([-sdec*cra, -sdec*sra, cdec])
+    r = np.array([cdec*cra, cdec*sra, sdec])
+    # Unit vector along increasing Galactic longitude, z-axis of Galactic system cross r.
+    p_gal = np.cross(ct.rotationMatrix[2, :], r, axisb=0, axisc=0)
+    p_gal = p_gal / np.sqrt(np.sum(p_gal*p_gal, axis=0))
+    c = np.sum(p_gal*p, axis=0)
+    s = np.sum(p_gal*q, axis=0)
+
+    pml = c*pmra + s*pmdec
+    pmb = c*pmdec - s*pmra
+
+    csqr = c*c
+    ssqr = s*s
+    covar = pmra_error*pmdec_error*pmra_pmdec_corr
+    var_pmra = pmra_error*pmra_error
+    var_pmdec = pmdec_error*pmdec_error
+    var_pml = csqr*var_pmra + ssqr*var_pmdec + 2.0*covar*c*s
+    var_pmb = ssqr*var_pmra + csqr*var_pmdec - 2.0*covar*c*s
+    covar_gal = (csqr-ssqr)*covar + c*s*(var_pmdec-var_pmra)
+
+    return pml, pmb, np.sqrt(var_pml), np.sqrt(var_pmb), covar_gal/np.sqrt(var_pml*var_pmb)
+
+
+def load_raw(infile):
+    """
+    Load the data from the input file and calculate the quantities needed for the sample selection: parallax over
+    error, tangential velocity, and the Galactic coordinates (l,b). Only the columns listed in _input_columns are kept
+    from the input file.
 
     Parameters
     ----------
@@ -44,98 +128,209 @@ def load_data(infile):
 
     Astropy Table with the data.
     """
-    obatable = Table.read(infile, format='fits')
-    obatable['parallax_over_error'] = obatable['parallax']/obatable['parallax_error']
-    obatable['vtan'] = (au_km_year_per_sec/obatable['parallax'] * np.sqrt(obatable['pmra']**2 +
-        obatable['pmdec']**2)).value*u.km/u.s
+    rawtable = Table.read(infile, format='fits', memmap=True)
+    names = [name for name in _input_columns if name in rawtable.colnames]
 
-    ct = CoordinateTransformation(Transformations.ICRS2GAL)
+    obatable = Table([rawtable[name].copy() for name in names], copy=False)
+    l, b = _icrs_to_gal.transform_sky_coordinates(np.deg2rad(np.ascontiguousarray(obatable['ra'].data)),
+            np.deg2rad(np.ascontiguousarray(obatable['dec'].data)))
 
-    l, b = ct.transform_sky_coordinates(np.deg2rad(obatable['ra']), np.deg2rad(obatable['dec']))
+    parallax = obatable['parallax'].data
+    obatable['parallax_over_error'] = parallax/obatable['parallax_error'].data
+    obatable['vtan'] = au_km_year_per_sec/parallax * np.hypot(obatable['pmra'].data, obatable['pmdec'].data)*u.km/u.s
     obatable['l'] = np.rad2deg(l)
     obatable['b'] = np.rad2deg(b)
-    obatable['pml'], obatable['pmb'] = ct.transform_proper_motions(np.deg2rad(obatable['ra']),
-            np.deg2rad(obatable['dec']), obatable['pmra'], obatable['pmdec'])
-    obatable['pml_error'], obatable['pmb_error'], obatable['pml_pmb_corr'] = \
-            ct.transform_proper_motion_errors(np.deg2rad(obatable['ra']), np.deg2rad(obatable['dec']),
-                    obatable['pmra_error'], obatable['pmdec_error'], rho_muphi_mutheta=obatable['pmra_pmdec_corr'])
-
-    icrs_coords = ICRS(ra = (obatable['ra'].data*u.deg).to(u.rad),
-            dec = (obatable['dec'].data*u.deg).to(u.rad),
-            distance = (1000/obatable['parallax'].data)*u.pc,
-            pm_ra_cosdec = obatable['pmra'].data*u.mas/u.yr,
-            pm_dec = obatable['pmdec'].data*u.mas/u.yr,
-            radial_velocity = obatable['ra'].value*0.0*u.km/u.s)
-
-    galactic_coords, galactocentric_cartesian, galactocentric_cylindrical = transform_to_galactic(icrs_coords,
-            galcendist=_Rsun, sunheight=_Zsun)
-
-    obatable['x_gc'] = galactocentric_cartesian.x
-    obatable['y_gc'] = galactocentric_cartesian.y
-    obatable['z_gc'] = galactocentric_cartesian.z
-    obatable['R_gc'] = galactocentric_cylindrical.rho
+
+    if 'logg_gspphot' in obatable.colnames and 'teff_gspphot' in obatable.colnames:
+        logg = obatable['logg_gspphot'].data
+        teff = obatable['teff_gspphot'].data
+        startype = np.full(len(obatable), -1, dtype=np.int16)
+        dwarfs = (logg > 4.0) & np.isfinite(teff)
+        startype[dwarfs] = np.digitize(teff[dwarfs], [4000, 5000, 6000], right=True)
+        startype[logg <= 3.0] = _startype_codes['giants']
+        obatable['startype'] = startype
 
     return obatable
 
 
-def make_plots(args):
+def load_cached(infile):
     """
-    Excecute the various steps to create the plots.
+    Load the data as done by load_raw() but keep a copy of the result in a FITS file next to the input file, which is
+    read instead on subsequent runs. The name of the cache file contains a hash of the size and the first MB of the
+    input file, the list of input columns, and _cache_version, so a changed input file or load_raw() leads to a new
+    cache file.
 
     Parameters
     ----------
 
-    args : dict
-        Command line arguments
+    infile : string
+        Location of input file.
 
     Returns
     -------
 
-    Nothing
+    Astropy Table with the data.
     """
-    if args['type'] in ['O','B','A']:
-        dr3table = load_data('data/OBAGoldenSample.fits')
-    elif args['type'] in ['F', 'G', 'K', 'M', 'giants']:
-        dr3table = load_data('data/FGKMGoldenSample.fits')
-    else:
-        print("Unknown source type!")
-        exit(0);
+    hasher = hashlib.sha1(str(os.path.getsize(infile)).encode())
+    with open(infile, 'rb') as f:
+        hasher.update(f.read(1<<20))
+    hasher.update(' '.join(_input_columns).encode())
+    hasher.update(str(_cache_version).encode())
+    cachefile = f"{infile}.proc.{hasher.hexdigest()[:12]}.fits"
+
+    if os.path.exists(cachefile):
+        return Table.read(cachefile, format='fits', memmap=True)
+    obatable = load_raw(infile)
+    # Write to a temporary file first so that concurrent or interrupted runs never see a partially written cache file.
+    tmpfile = cachefile + f'.tmp{os.getpid()}'
+    try:
+        obatable.write(tmpfile, format='fits', overwrite=True)
+        os.replace(tmpfile, cachefile)
+    finally:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+    return obatable
+
+
+def augment_galactic(obatable):
+    """
+    Calculate the proper motions in Galactic coordinates and the positions in the Galactocentric (Cartesian)
+    coordinate system for the stars in the input table. To save time apply this only to the selected sample of stars.
+
+    Parameters
+    ----------
+
+    obatable : astropy.table.Table
+        Table with the data as returned by load_raw().
+
+    Returns
+    -------
+
+    Astropy Table with the additional columns.
+    """
+    ra_rad = np.deg2rad(np.ascontiguousarray(obatable['ra'].data))
+    dec_rad = np.deg2rad(np.ascontiguousarray(obatable['dec'].data))
+    obatable['pml'], obatable['pmb'], obatable['pml_error'], obatable['pmb_error'], obatable['pml_pmb_corr'] = \
+            galactic_proper_motions(_icrs_to_gal, ra_rad, dec_rad, obatable['pmra'], obatable['pmdec'],
+                    obatable['pmra_error'], obatable['pmdec_error'], obatable['pmra_pmdec_corr'])
+
+    distance = 1000/obatable['parallax'].data
+    cdec = np.cos(dec_rad)
+    xyz_icrs = distance*np.array([cdec*np.cos(ra_rad), cdec*np.sin(ra_rad), np.sin(dec_rad)])
+    xyz_gc = _icrs_to_galcen_matrix @ xyz_icrs + _galcen_offset[:, np.newaxis]
+
+    obatable['x_gc'] = xyz_gc[0]*u.pc
+    obatable['y_gc'] = xyz_gc[1]*u.pc
+    obatable['z_gc'] = xyz_gc[2]*u.pc
+    obatable['R_gc'] = np.hypot(xyz_gc[0], xyz_gc[1])*u.pc
 
+    return obatable
+
+
+def binned_median(x, y, values, extent, gridsize):
+    """
+    Calculate the median of the values in a rectangular grid of bins in (x,y).
+
+    Parameters
+    ----------
+
+    x, y : float arrays
+        Coordinates of the data points.
+    values : float array
+        Values for which to calculate the median in each bin.
+    extent : list
+        Range covered by the grid, [xmin, xmax, ymin, ymax].
+    gridsize : int or pair of int
+        Number of bins along each axis, or along x and y separately.
+
+    Returns
+    -------
+
+    Array of shape (nx, ny) with the median values, indexed as [x,y]. Empty bins contain NaN.
+    """
+    median_values, _, _, _ = binned_statistic_2d(x, y, values, statistic='median', bins=gridsize,
+            range=[extent[0:2], extent[2:4]])
+    return median_values
+
+
+def select_sample(dr3table, sourcetype):
+    """
+    Select the sample of stars of the given type and extract the quantities needed for the plots.
+
+    Parameters
+    ----------
+
+    dr3table : astropy.table.Table
+        Table with the data as returned by load_cached().
+    sourcetype : string
+        Source type to plot: O, B, A, F, G, K, M, giants
+
+    Returns
+    -------
+
+    Galactic longitude (degrees), Galactocentric x and y (kpc), and pml (mas/yr) of the selected stars as float32
+    arrays.
+    """
     plx_snrlim = 10
     vtanhalo = 180.0
     zmax = 250
 
-    plxfilter = dr3table['parallax_over_error']>plx_snrlim
-    nonhalo = dr3table['vtan'] < vtanhalo
-    zfilter = np.abs(np.sin(np.deg2rad(dr3table['b']))*1000/dr3table['parallax']) < zmax
-
-    if args['type'] in ['O','B','A']:
-        startype = (dr3table['spectraltype_esphs'] == args['type'])
-    elif args['type'] == 'F':
-        startype = (dr3table['logg_gspphot'] > 4.0) & (dr3table['teff_gspphot'] > 6000)
-    elif args['type'] == 'G':
-        startype = (dr3table['logg_gspphot'] > 4.0) & (dr3table['teff_gspphot'] <= 6000) & (dr3table['teff_gspphot'] > 5000)
-    elif args['type'] == 'K':
-        startype = (dr3table['logg_gspphot'] > 4.0) & (dr3table['teff_gspphot'] <= 5000) & (dr3table['teff_gspphot'] > 4000)
-    elif args['type'] == 'M':
-        startype = (dr3table['logg_gspphot'] > 4.0) & (dr3table['teff_gspphot'] <= 4000)
+    # Work on the plain ndarrays to avoid the Column overhead on each operation.
+    parallax = dr3table['parallax'].data
+    plxfilter = dr3table['parallax_over_error'].data > plx_snrlim
+    nonhalo = dr3table['vtan'].data < vtanhalo
+    zfilter = np.abs(np.sin(np.deg2rad(dr3table['b'].data))*1000/parallax) < zmax
+
+    if sourcetype in ['O','B','A']:
+        # The Column comparison takes care of the bytes versus str conversion.
+        startype = (dr3table['spectraltype_esphs'] == sourcetype)
     else:
-        startype = (dr3table['logg_gspphot'] <= 3.0)
+        startype = dr3table['startype'].data == _startype_codes[sourcetype]
+
+    sample_filter = np.logical_and.reduce((startype, plxfilter, nonhalo, zfilter))
+    dr3table = augment_galactic(dr3table[sample_filter])
+
+    print(f"Number of stars in selected sample ({sourcetype}): {len(dr3table)}")
+
+    # Extract the plotted quantities once, single precision is sufficient for the plots.
+    galon = dr3table['l'].data.astype(np.float32)
+    x = (dr3table['x_gc'].data/1000).astype(np.float32)
+    y = (dr3table['y_gc'].data/1000).astype(np.float32)
+    pml = dr3table['pml'].data.astype(np.float32)
+
+    return galon, x, y, pml
+
+
+def make_type_plots(sourcetype, galon, x, y, pml, simplelang):
+    """
+    Create the plots for the selected sample of stars of the given type.
+
+    Parameters
+    ----------
 
-    name = args['type']+'_'
+    sourcetype : string
+        Source type to plot: O, B, A, F, G, K, M, giants
+    galon, x, y, pml : float arrays
+        Quantities for the selected stars as returned by select_sample().
+    simplelang : boolean
+        If true simplify the language on the axes.
 
-    sample_filter =  startype & plxfilter & nonhalo & zfilter
+    Returns
+    -------
 
-    print(f"Number of stars in selected sample: {dr3table['ra'][sample_filter].size}")
+    Nothing
+    """
+    name = sourcetype+'_'
 
     plt.style.use('agab.mplstyle')
     fig, ax_lmul = plt.subplots(1, 1, tight_layout=True, figsize=(14,5))
 
-    ax_lmul.hexbin(dr3table['l'][sample_filter], dr3table['pml'][sample_filter], 
-                             gridsize=[360,100], mincnt=1, bins='log', extent=[0,360,-20,20])
+    counts, _, _ = np.histogram2d(galon, pml, bins=[360,100], range=[[0,360],[-20,20]])
+    ax_lmul.imshow(np.ma.masked_less(counts, 1).T, origin='lower', extent=[0,360,-20,20], aspect='auto',
+            interpolation='nearest', norm=LogNorm())
     ax_lmul.set_xlabel(r'Galactic longitude')
     ax_lmul.xaxis.set_major_formatter('${x:.0f}^\circ$')
-    if args['simpleLang']:
+    if simplelang:
         ax_lmul.set_ylabel(r'$\mu$ [mas yr$^{-1}$]')
     else:
         ax_lmul.set_ylabel(r'$\mu_{\ell*}$ [mas yr$^{-1}$]')
@@ -145,8 +340,8 @@ def make_plots(args):
     plt.close()
 
     fig, ax_xy = plt.subplots(1, 1, figsize=(8,8), tight_layout=True)
-    ax_xy.hexbin(dr3table['x_gc'][sample_filter]/1000, dr3table['y_gc'][sample_filter]/1000, mincnt=1, bins='log',
-            extent=[-15,-4,-8,8], gridsize=200)
+    ax_xy.hexbin(x, y, mincnt=1, bins='log',
+            extent=[-15,-4,-8,8], gridsize=200, rasterized=True)
     ax_xy.set_xlabel(r'$X$ [kpc]')
     ax_xy.set_ylabel(r'$Y$ [kpc]')
 
@@ -157,14 +352,12 @@ def make_plots(args):
     gs = GridSpec(1, 2, figure=fig, width_ratios=[8,2])
     ax_xy_pml = fig.add_subplot(gs[0,0])
 
-    im_xy_pml = ax_xy_pml.hexbin(dr3table['x_gc'][sample_filter]/1000, dr3table['y_gc'][sample_filter]/1000, mincnt=0,
-            C=dr3table['pml'][sample_filter], extent=[-15,-4,-8,8], gridsize=200, reduce_C_function=np.median,
-            cmap='plasma')
-    ax_xy_pml.clear()
-    imnorm = ImageNormalize(im_xy_pml.get_array(), stretch=HistEqStretch(im_xy_pml.get_array()))
-    im_xy_pml =ax_xy_pml.hexbin(dr3table['x_gc'][sample_filter]/1000, dr3table['y_gc'][sample_filter]/1000, mincnt=0,
-            C=dr3table['pml'][sample_filter], extent=[-15,-4,-8,8], gridsize=200, reduce_C_function=np.median,
-            cmap='plasma', norm=imnorm)
+    # Choose the number of bins in y such that the bins are square.
+    median_pml = binned_median(x, y, pml, [-15,-4,-8,8], (200, round(200*16/11)))
+    finite_pml = median_pml[np.isfinite(median_pml)]
+    imnorm = ImageNormalize(finite_pml, stretch=HistEqStretch(finite_pml))
+    im_xy_pml = ax_xy_pml.imshow(median_pml.T, origin='lower', extent=[-15,-4,-8,8], aspect='auto',
+            interpolation='nearest', cmap='plasma', norm=imnorm)
     ax_xy_pml.set_xlabel(r'$X$ [kpc]')
     ax_xy_pml.set_ylabel(r'$Y$ [kpc]')
     cax_xy_pml = inset_axes(ax_xy_pml, "2.5%", "90%", loc='center left', 
@@ -178,12 +371,57 @@ def make_plots(args):
     plt.close()
 
 
+def make_plots(args):
+    """
+    Excecute the various steps to create the plots.
+
+    Parameters
+    ----------
+
+    args : dict
+        Command line arguments
+
+    Returns
+    -------
+
+    Nothing
+    """
+    if args['all']:
+        sourcetypes = list(_input_files.keys())
+    elif args['type'] in _input_files:
+        sourcetypes = [args['type']]
+    else:
+        print("Unknown source type!")
+        exit(0);
+
+    # The sample selection needs the full tables, so do it here. Only the small per-type arrays are passed on to the
+    # worker processes that make the plots.
+    tables = {}
+    samples = {}
+    for sourcetype in sourcetypes:
+        if _input_files[sourcetype] not in tables:
+            tables[_input_files[sourcetype]] = load_cached(_input_files[sourcetype])
+        samples[sourcetype] = select_sample(tables[_input_files[sourcetype]], sourcetype)
+    del tables
+
+    if len(sourcetypes) == 1:
+        make_type_plots(sourcetypes[0], *samples[sourcetypes[0]], args['simpleLang'])
+    else:
+        # The plots for the different source types are independent, so make them in parallel.
+        with ProcessPoolExecutor() as executor:
+            futures = [executor.submit(make_type_plots, sourcetype, *samples[sourcetype], args['simpleLang'])
+                    for sourcetype in sourcetypes]
+            for future in futures:
+                future.result()
+
+
 def parseCommandLineArguments():
     """
     Set up command line parsing.
     """
     parser = argparse.ArgumentParser(description="""Observational plots to accompany animation""")
     parser.add_argument("--type", type=str, default='B', help="""Source type to plot: O, B, A, F, G, K, M, giants""")
+    parser.add_argument("--all", action="store_true", dest="all", help="Make the plots for all source types")
     parser.add_argument("-l", action="store_true", dest="simpleLang", help="Simplify language on the axes")
     parser.add_argument("-p", action="store_true", dest="pdfOutput", help="Make PDF plots")
     parser.add_argument("-b", action="store_true", dest="pngOutput", help="Make PNG plots")
@@ -34,13 +34,16 @@ def make_plot(args):
     r = np.linspace(0, 16, 1000)
     h = args['hlen']
     p = args['pexp']
-    rotcur = lambda x : x/h * np.power(1 + (x/h)**2, (p-2)/4)
+    pexp = (p-2)/4
+    rotcur = lambda x : x/h * (1 + (x/h)**2)**pexp
 
     v0 = args['vcsun']/rotcur(args['rsun'])
     vc = v0*rotcur(r)
 
     x = args['rsun']
-    slopesun = v0*( (1/h)*np.power(1 + (x/h)**2, (p-2)/4) + (x**2/h**3)*((p-2)/2)*np.power(1 + (x/h)**2, (p-6)/4) )
+    # (1+(x/h)^2)^((p-6)/4) = (1+(x/h)^2)^((p-2)/4) / (1+(x/h)^2), so only one power is needed.
+    base = 1 + (x/h)**2
+    slopesun = v0*base**pexp*( (1/h) + (x**2/h**3)*((p-2)/2)/base )
     
     useagab()
     fig, ax = plt.subplots(1, 1, figsize=(8,6), tight_layout=True)